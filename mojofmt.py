@@ -21,24 +21,28 @@ from __future__ import annotations
 
 import argparse
 import difflib
+import hashlib
 import logging
 import os
 import re
 import shutil
 import subprocess
 import sys
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass, replace as dc_replace
+from functools import lru_cache
 from pathlib import Path
-from typing import Iterable, List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 VERSION = "0.1.9"
 
 DEFAULT_EXTENSIONS = (".ep", ".htm.ep", ".html.ep")
-VOID_ELEMENTS = {
+VOID_ELEMENTS = frozenset({
     "area", "base", "br", "col", "embed", "hr", "img", "input",
     "link", "meta", "param", "source", "track", "wbr",
-}
-RAW_ELEMENTS = {"pre", "script", "style", "textarea"}
+})
+RAW_ELEMENTS = frozenset({"pre", "script", "style", "textarea"})
 
 logger = logging.getLogger("mojofmt")
 
@@ -54,45 +58,72 @@ TAG_RE = re.compile(
     re.VERBOSE,
 )
 
-# Mojolicious inline tags on a single line: <%...%>
-TPL_TAG_RE = re.compile(
-    r"""
-    <%
-      (?P<leftchomp>-)?                # optional left chomp
-      (?P<kind>==|=|\#)?               # kind: ==, =, or #
-      (?P<body>.*?)                    # inner code/comment (non-greedy, no newlines)
-      (?P<rightchomp>-)?               # optional right chomp
-    %>
-    """,
-    re.VERBOSE,
-)
-
 # Line directives: starts with % (possibly %= %== %#) after indentation
 LINE_DIR_RE = re.compile(r"^(?P<indent>\s*)%(?P<kind>==|=|\#)?(?P<body>.*)$")
 
 # Whitespace condensing for single-line normalization
 WS_RE = re.compile(r"[ \t]+")
 
-# begin/end detection (heuristic)
-BEGIN_RE = re.compile(r"\bbegin\b")
-END_LINE_RE = re.compile(r"^\s*%\s*end\b")
-END_TAG_ONLY_RE = re.compile(r"^\s*<%-?\s*end\s*-?%>\s*$")
-
-# leading } in a directive (e.g., % } or % }} )
-LEADING_RBRACE_COUNT_RE = re.compile(r"^\s*%\s*(?P<braces>\}+)")
+# Braces only, for matching the do { ... } wrapper in perltidy output
+BRACE_RE = re.compile(r"[{}]")
 
-# <% } %> alone
-TAG_CLOSING_BRACE_ONLY_RE = re.compile(r"^\s*<%-?\s*\}+\s*-?%>\s*$")
+# Lines that close a Perl block before they are printed; the alternatives are
+# mutually exclusive, so one match tells which kind (see PERL_DEDENT_BY_KIND)
+PERL_DEDENT_RE = re.compile(
+    r"""
+    ^\s*
+    (?:
+        %\s*(?:(?P<end>end\b)|(?P<braces>\}+))                       # % end, % } or % }}
+      | <%-?\s*(?:(?P<tag_end>end)|(?P<tag_braces>\}+))\s*-?%>\s*$   # <% end %> or <% } %> alone
+    )
+    """,
+    re.VERBOSE,
+)
+PERL_DEDENT_BY_KIND = {
+    "end": lambda m: 1,
+    "braces": lambda m: len(m.group("braces")),
+    "tag_end": lambda m: 1,
+    "tag_braces": lambda m: 1,
+}
 
-# Detect raw element opening/closing (as standalone lines)
-RAW_OPEN_RE = re.compile(r"^\s*<(?P<name>pre|script|style|textarea)\b[^>]*>\s*$", re.I)
+# Detect raw element opening/closing (as standalone lines) in a single match
+RAW_LINE_RE = re.compile(
+    r"^\s*<(?:/(?P<close>pre|script|style|textarea)\s*|(?P<open>pre|script|style|textarea)\b[^>]*)>\s*$",
+    re.I,
+)
+# Inside a raw block only the closing line matters
 RAW_CLOSE_RE = re.compile(r"^\s*</(?P<name>pre|script|style|textarea)\s*>\s*$", re.I)
 
-# Extended EP block delimiters (opening/closing on their own lines)
-OPEN_BLOCK_RE = re.compile(r'^(?P<base>[ \t]*)<%(?P<left>-?)(?![=#])\s*$')
-CLOSE_BLOCK_RE = re.compile(
-    r'^(?P<base>[ \t]*)(?P<right>-?)%(?:>| >)\s*$'
-)
+# Extended EP block delimiters (opening/closing on their own lines), as they
+# appear once the line's [ \t]* indent and trailing whitespace are removed
+OPEN_BLOCK_DELIMS = ("<%", "<%-")
+CLOSE_BLOCK_DELIMS = ("%>", "-%>", "% >", "-% >")
+
+# Marker comment separating extended blocks in a batched perltidy run
+BLOCK_MARKER = "# __MOJOFMT_BLOCK_BOUNDARY__"
+BLOCK_MARKER_RE = re.compile(r"^[ \t]*# __MOJOFMT_BLOCK_BOUNDARY__ (\d+)[ \t]*$", re.M)
+# __END__/__DATA__ end the program and POD swallows lines up to =cut, so
+# either would take the following blocks and markers with it in a batch
+BATCH_UNSAFE_RE = re.compile(r"^\s*(?:__END__|__DATA__)\b|^=[a-zA-Z]", re.M)
+
+# Keyword spacing rules for the optional --perl-keyword-spacing post-pass
+# Add space after control keywords before '('
+KW_CTRL_PAREN_RE = re.compile(r"\b(?P<kw>if|elsif|unless|while|until|for|foreach|given|when)\s*\(")
+# Add space after declarators before sigils/paren
+KW_DECL_RE = re.compile(r"\b(?P<kw>my|our|state|local)\s*(?=[\$\@\%\*\&\\\(])")
+# sub name spacing and brace spacing
+KW_SUB_NAMED_RE = re.compile(r"\bsub\s*([A-Za-z_]\w*)")
+KW_SUB_NAMED_BRACE_RE = re.compile(r"\bsub\s+([A-Za-z_]\w*)\s*\{")
+KW_SUB_ANON_RE = re.compile(r"\bsub\s*\{")
+# Calls which often appear without space
+KW_CALL_PAREN_RE = re.compile(r"\b(?P<kw>return|print|say|die|warn|exit)\s*\(")
+KW_CALL_SPACE_RE = re.compile(r"\b(?P<kw>return|print|say|die|warn|exit)\s*(?=\S)")
+# else/continue/do/eval blocks
+KW_ELSE_BRACE_RE = re.compile(r"\b(?P<kw>else|continue|do|eval)\s*\{")
+# Ensure space before a brace after a closing paren: "){" -> ") {"
+KW_BRACE_AFTER_PAREN_RE = re.compile(r"\)\s*\{")
+# Ensure space between '}' and a following keyword: "}else" -> "} else"
+KW_BRACE_THEN_KW_RE = re.compile(r"\}\s*(?=\b(?:else|elsif|continue|when)\b)")
 
 
 @dataclass
@@ -138,8 +169,15 @@ def setup_logging(level_name: Optional[str], verbose_flag: bool) -> None:
         "critical": logging.CRITICAL,
     }.get(name, logging.ERROR)
 
-    fmt = "mojofmt: %(levelname)s: %(message)s"
-    logging.basicConfig(level=level, format=fmt)
+    # Configure only our own logger, and attach its handler once: importing
+    # mojofmt as a library (e.g. from the web frontend) leaves the root
+    # logger alone, and a repeated setup just adjusts the level.
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("mojofmt: %(levelname)s: %(message)s"))
+        logger.addHandler(handler)
+        logger.propagate = False
+    logger.setLevel(level)
 
 
 def detect_eol(text: str) -> str:
@@ -148,24 +186,26 @@ def detect_eol(text: str) -> str:
     return "lf"
 
 
-def normalize_eol(text: str, eol: str) -> str:
-    if eol == "preserve":
-        return text
-    s = text.replace("\r\n", "\n").replace("\r", "\n")
-    if eol == "lf":
-        return s
-    elif eol == "crlf":
-        return s.replace("\n", "\r\n")
-    else:
-        return s
+_PERLTIDY_WARNED = False  # avoid spamming logs if perltidy missing repeatedly
+PERLTIDY_CACHE_SIZE = 1024  # distinct (options, snippet) pairs kept per process
+PERLTIDY_TIMEOUT = 10  # seconds per perltidy run before falling back
+PERLTIDY_CACHE_MAX_CODE = 4096  # longer snippets (whole batched documents) are not kept
+_PERLTIDY_CACHE: "OrderedDict[Tuple[Tuple[str, ...], str], Tuple[int, str, str]]" = OrderedDict()
+_PERLTIDY_CACHE_LOCK = threading.Lock()
+# Per-thread record of whether a perltidy run failed (timeout, bad exit) since
+# format_string_cached last reset it; such output must not be cached
+_PERLTIDY_STATE = threading.local()
 
 
-_PERLTIDY_WARNED = False  # avoid spamming logs if perltidy missing repeatedly
+@lru_cache(maxsize=1)
+def _find_perltidy() -> Optional[str]:
+    # PATH lookup stats every directory; do it once per process
+    return shutil.which("perltidy")
 
 
 def run_perltidy(code: str, cfg: Config) -> Tuple[int, str, str]:
     global _PERLTIDY_WARNED
-    exe = cfg.perltidy_path or shutil.which("perltidy")
+    exe = cfg.perltidy_path or _find_perltidy()
     if not exe:
         if not _PERLTIDY_WARNED:
             logger.error("perltidy not found; Perl inside template will not be reformatted")
@@ -175,8 +215,12 @@ def run_perltidy(code: str, cfg: Config) -> Tuple[int, str, str]:
     args: List[str] = [exe]
     if cfg.perltidy_options:
         args += cfg.perltidy_options
+        # Keep all perltidy I/O on pipes: -st sends the result to stdout and
+        # -se sends errors to stderr instead of a perltidy.ERR file in the cwd.
         if not any(opt.startswith("-st") for opt in cfg.perltidy_options):
             args.append("-st")
+        if not any(opt.startswith("-se") for opt in cfg.perltidy_options):
+            args.append("-se")
     else:
         args += [
             f"-i={cfg.indent_width}",
@@ -188,28 +232,76 @@ def run_perltidy(code: str, cfg: Config) -> Tuple[int, str, str]:
             "-nbbc",
             "-noll",
         ]
-    logger.debug("Running perltidy: %s", " ".join(args))
+    try:
+        result = _run_perltidy_cached(tuple(args), code)
+    except FileNotFoundError:
+        if not _PERLTIDY_WARNED:
+            logger.error("perltidy not found while executing")
+            _PERLTIDY_WARNED = True
+        return (127, code, "perltidy not found")
+    if result[0] != 0:
+        _PERLTIDY_STATE.failed = True
+    return result
+
+
+def _run_perltidy_cached(args: Tuple[str, ...], code: str) -> Tuple[int, str, str]:
+    """
+    Run perltidy on code. Templates repeat the same snippets (loop headers,
+    helper calls, closing braces), so successful results for short snippets
+    are memoized per argument list and input. Failures and large inputs are
+    not kept; FileNotFoundError propagates.
+    """
+    cacheable = len(code) <= PERLTIDY_CACHE_MAX_CODE
+    if cacheable:
+        key = (args, code)
+        with _PERLTIDY_CACHE_LOCK:
+            hit = _PERLTIDY_CACHE.get(key)
+            if hit is not None:
+                _PERLTIDY_CACHE.move_to_end(key)
+                return hit
+    result = _run_perltidy(args, code)
+    if cacheable and result[0] == 0:
+        with _PERLTIDY_CACHE_LOCK:
+            _PERLTIDY_CACHE[key] = result
+            while len(_PERLTIDY_CACHE) > PERLTIDY_CACHE_SIZE:
+                _PERLTIDY_CACHE.popitem(last=False)
+    return result
+
+
+def _run_perltidy(args: Tuple[str, ...], code: str) -> Tuple[int, str, str]:
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Running perltidy: %s", " ".join(args))
+    # Bytes on the pipes, decoded once: no incremental codec, and UTF-8
+    # regardless of the locale
     try:
         proc = subprocess.run(
             args,
-            input=code,
+            input=code.encode("utf-8"),
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
-            text=True,
             check=False,
+            timeout=PERLTIDY_TIMEOUT,
         )
-        if proc.returncode != 0:
-            logger.debug("perltidy non-zero exit %s: %s", proc.returncode, (proc.stderr or "").strip())
-        return (proc.returncode, proc.stdout, proc.stderr)
-    except FileNotFoundError:
-        if not _PERLTIDY_WARNED:
-            logger.error("perltidy not found while executing")
-            _PERLTIDY_WARNED = True
-        return (127, code, "perltidy not found")
+    except subprocess.TimeoutExpired:
+        # A hung perltidy would otherwise pin the caller's thread forever;
+        # a non-zero status sends the caller down the naive fallback
+        logger.warning("perltidy timed out after %ss", PERLTIDY_TIMEOUT)
+        return (124, code, "perltidy timed out")
+    out = proc.stdout.decode("utf-8", "replace")
+    err = proc.stderr.decode("utf-8", "replace")
+    # Without text mode there is no universal-newline translation, so fold
+    # any CRLF or CR from perltidy to LF here
+    if "\r" in out:
+        out = out.replace("\r\n", "\n").replace("\r", "\n")
+    if "\r" in err:
+        err = err.replace("\r\n", "\n").replace("\r", "\n")
+    if proc.returncode != 0 and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("perltidy non-zero exit %s: %s", proc.returncode, err.strip())
+    return (proc.returncode, out, err)
 
 
 def perltidy_probe(cfg: Config) -> Tuple[bool, str]:
-    exe = cfg.perltidy_path or shutil.which("perltidy")
+    exe = cfg.perltidy_path or _find_perltidy()
     if not exe:
         return (False, "perltidy not found on PATH (install Perl::Tidy or pass --perltidy)")
     snippet = "my $x=  {a=>1,b =>2 };"
@@ -224,13 +316,20 @@ def perltidy_probe(cfg: Config) -> Tuple[bool, str]:
     return (False, "perltidy produced unexpected output")
 
 
+def collapse_ws(s: str) -> str:
+    """WS_RE.sub(" ", s), skipping the regex when there is nothing to collapse."""
+    if "  " not in s and "\t" not in s:
+        return s
+    return WS_RE.sub(" ", s)
+
+
 def tidy_perl_statement_oneline(code: str, cfg: Config) -> str:
     rc, out, _ = run_perltidy(code, cfg)
     if rc != 0:
         out = code
     out = out.strip()
     out = " ".join(out.splitlines())
-    out = WS_RE.sub(" ", out).strip()
+    out = collapse_ws(out).strip()
     out = enforce_perl_keyword_spacing(out, cfg.perl_keyword_spacing)
     return out
 
@@ -241,59 +340,46 @@ def tidy_perl_expression(code: str, cfg: Config) -> str:
     if rc != 0:
         inner = code.strip()
         return enforce_perl_keyword_spacing(inner, cfg.perl_keyword_spacing)
-    text = out
-    try:
-        start = text.index("{")
-        depth = 0
-        end_idx = None
-        for i in range(start, len(text)):
-            ch = text[i]
-            if ch == "{":
-                depth += 1
-            elif ch == "}":
-                depth -= 1
-                if depth == 0:
-                    end_idx = i
-                    break
-        if end_idx is None:
-            inner = code.strip()
-        else:
-            inner = text[start + 1 : end_idx]
-    except ValueError:
+    span = _first_brace_block(out)
+    if span is None:
         inner = code.strip()
+    else:
+        inner = out[span[0] + 1 : span[1]]
     inner = " ".join(line.strip() for line in inner.splitlines())
-    inner = WS_RE.sub(" ", inner).strip()
+    inner = collapse_ws(inner).strip()
     inner = enforce_perl_keyword_spacing(inner, cfg.perl_keyword_spacing)
     return inner
 
 
-def tidy_perl_block_multiline(code: str, cfg: Config) -> Optional[str]:
+def _first_brace_block(text: str) -> Optional[Tuple[int, int]]:
     """
-    Format a multi-line chunk of Perl by wrapping it in a do { ... } block for perltidy.
-    Returns the formatted inner text (without the wrapper) or None on failure.
+    Return (open_idx, close_idx) of the first balanced { ... } in text, or None.
+    BRACE_RE jumps straight from brace to brace instead of visiting every
+    character of the perltidy output in Python.
     """
-    wrapped = "do {\n" + code + "\n}"
-    rc, out, _ = run_perltidy(wrapped, cfg)
-    if rc != 0 or not out:
-        return None
-    try:
-        start = out.index("{")
-    except ValueError:
-        return None
     depth = 0
-    end_idx = None
-    for i in range(start, len(out)):
-        ch = out[i]
-        if ch == "{":
+    start = None
+    for m in BRACE_RE.finditer(text):
+        if m.group() == "{":
+            if start is None:
+                start = m.start()
             depth += 1
-        elif ch == "}":
+        elif start is not None:
             depth -= 1
             if depth == 0:
-                end_idx = i
-                break
-    if end_idx is None:
+                return start, m.start()
+    return None
+
+
+def _unwrap_do_block(out: str) -> Optional[str]:
+    """
+    Return the body of the first { ... } block in perltidy output, without the
+    newline that follows the opening brace or precedes the closing one.
+    """
+    span = _first_brace_block(out)
+    if span is None:
         return None
-    inner = out[start + 1 : end_idx]
+    inner = out[span[0] + 1 : span[1]]
     if inner.startswith("\n"):
         inner = inner[1:]
     if inner.endswith("\n"):
@@ -301,6 +387,65 @@ def tidy_perl_block_multiline(code: str, cfg: Config) -> Optional[str]:
     return inner
 
 
+def tidy_perl_block_multiline(code: str, cfg: Config) -> Optional[str]:
+    """
+    Format a multi-line chunk of Perl by wrapping it in a do { ... } block for perltidy.
+    Returns the formatted inner text (without the wrapper) or None on failure.
+    """
+    wrapped = "do {\n" + code + "\n}"
+    rc, out, _ = run_perltidy(wrapped, cfg)
+    if rc != 0 or not out:
+        return None
+    return _unwrap_do_block(out)
+
+
+def tidy_perl_blocks_multiline(codes: List[str], cfg: Config) -> List[Optional[str]]:
+    """
+    Format several multi-line chunks of Perl with a single perltidy run.
+    Each chunk is wrapped in its own do { ... }; block followed by a marker
+    comment, and the output is split back apart on the markers. Chunks with
+    unbalanced brackets, __END__/__DATA__ or POD would bleed into their
+    neighbours, so they are formatted on their own; if the batched run
+    fails or does not split cleanly, every chunk falls back to
+    tidy_perl_block_multiline.
+    """
+    results: List[Optional[str]] = [None] * len(codes)
+    batch_idx = [
+        k for k, code in enumerate(codes)
+        if code.count("{") == code.count("}")
+        and code.count("(") == code.count(")")
+        and code.count("[") == code.count("]")
+        and BLOCK_MARKER not in code
+        and not BATCH_UNSAFE_RE.search(code)
+    ]
+    if len(batch_idx) < 2:
+        batch_idx = []
+    batched = False
+    if batch_idx:
+        batch = "".join(
+            f"do {{\n{codes[k]}\n}};\n{BLOCK_MARKER} {n}\n" for n, k in enumerate(batch_idx)
+        )
+        rc, out, _ = run_perltidy(batch, cfg)
+        if rc == 0 and out:
+            # re.split with one group yields [seg0, "0", seg1, "1", ..., tail]
+            parts = BLOCK_MARKER_RE.split(out)
+            if (
+                len(parts) == 2 * len(batch_idx) + 1
+                and parts[1::2] == [str(n) for n in range(len(batch_idx))]
+                and (not parts[-1] or parts[-1].isspace())
+            ):
+                for k, seg in zip(batch_idx, parts[0:-1:2]):
+                    results[k] = _unwrap_do_block(seg)
+                batched = True
+        if not batched:
+            logger.debug("Batched perltidy run failed; formatting %d EP blocks one by one", len(batch_idx))
+    done = set(batch_idx) if batched else set()
+    for k, code in enumerate(codes):
+        if k not in done:
+            results[k] = tidy_perl_block_multiline(code, cfg)
+    return results
+
+
 def _split_code_and_strings(s: str):
     chunks = []
     buf: List[str] = []
@@ -353,70 +498,45 @@ def _split_unquoted_comment(code_chunk: str):
 def enforce_perl_keyword_spacing(s: str, enable: bool) -> str:
     if not enable or not s:
         return s
-    # Add space after control keywords before '('
-    ctrl_paren = re.compile(r"\b(?P<kw>if|elsif|unless|while|until|for|foreach|given|when)\s*\(")
-    # Add space after declarators before sigils/paren
-    decl = re.compile(r"\b(?P<kw>my|our|state|local)\s*(?=[\$\@\%\*\&\\\(])")
-    # sub name spacing and brace spacing
-    sub_named = re.compile(r"\bsub\s*([A-Za-z_]\w*)")
-    sub_named_brace = re.compile(r"\bsub\s+([A-Za-z_]\w*)\s*\{")
-    sub_anon = re.compile(r"\bsub\s*\{")
-    # Calls which often appear without space
-    call_paren = re.compile(r"\b(?P<kw>return|print|say|die|warn|exit)\s*\(")
-    call_space = re.compile(r"\b(?P<kw>return|print|say|die|warn|exit)\s*(?=\S)")
-    # else/continue/do/eval blocks
-    else_brace = re.compile(r"\b(?P<kw>else|continue|do|eval)\s*\{")
-    # Ensure space before a brace after a closing paren: "){" -> ") {"
-    brace_after_paren = re.compile(r"\)\s*\{")
-    # Ensure space between '}' and a following keyword: "}else" -> "} else"
-    brace_then_kw = re.compile(r"\}\s*(?=\b(?:else|elsif|continue|when)\b)")
-
     out: List[str] = []
     for kind, chunk in _split_code_and_strings(s):
         if kind != "code":
             out.append(chunk)
             continue
         code, comment = _split_unquoted_comment(chunk)
-        code = ctrl_paren.sub(lambda m: f"{m.group('kw')} (", code)
-        code = decl.sub(lambda m: f"{m.group('kw')} ", code)
-        code = sub_named.sub(lambda m: f"sub {m.group(1)}", code)
-        code = sub_named_brace.sub(lambda m: f"sub {m.group(1)} {{", code)
-        code = sub_anon.sub("sub {", code)
-        code = call_paren.sub(lambda m: f"{m.group('kw')} (", code)
-        code = call_space.sub(lambda m: f"{m.group('kw')} ", code)
-        code = brace_then_kw.sub("} ", code)
-        code = else_brace.sub(lambda m: f"{m.group('kw')} {{", code)
-        code = brace_after_paren.sub(") {", code)
+        code = KW_CTRL_PAREN_RE.sub(r"\g<kw> (", code)
+        code = KW_DECL_RE.sub(r"\g<kw> ", code)
+        code = KW_SUB_NAMED_RE.sub(r"sub \1", code)
+        code = KW_SUB_NAMED_BRACE_RE.sub(r"sub \1 {", code)
+        code = KW_SUB_ANON_RE.sub("sub {", code)
+        code = KW_CALL_PAREN_RE.sub(r"\g<kw> (", code)
+        code = KW_CALL_SPACE_RE.sub(r"\g<kw> ", code)
+        code = KW_BRACE_THEN_KW_RE.sub("} ", code)
+        code = KW_ELSE_BRACE_RE.sub(r"\g<kw> {", code)
+        code = KW_BRACE_AFTER_PAREN_RE.sub(") {", code)
         out.append(code + (comment or ""))
     return "".join(out)
 
 
 def _common_leading_ws(lines: List[str]) -> str:
-    ws = None
-    for ln in lines:
-        if not ln.strip():
-            continue
-        lead = len(ln) - len(ln.lstrip(' \t'))
-        s = ln[:lead]
-        if ws is None:
-            ws = s
-        else:
-            i = 0
-            while i < len(ws) and i < len(s) and ws[i] == s[i]:
-                i += 1
-            ws = ws[:i]
-    return ws or ""
+    leads = [ln[: len(ln) - len(ln.lstrip(" \t"))] for ln in lines if ln and not ln.isspace()]
+    # commonprefix is a plain character-wise prefix (min/max compare in C)
+    return os.path.commonprefix(leads)
 
 
 def _dedent_block(text: str) -> str:
     lines = text.splitlines()
-    # Trim leading/trailing all-whitespace lines
-    while lines and not lines[0].strip():
-        lines.pop(0)
-    while lines and not lines[-1].strip():
-        lines.pop()
-    if not lines:
+    # Trim leading/trailing all-whitespace lines (slice once rather than
+    # pop(0), which shifts the whole list for every leading blank line)
+    start = 0
+    end = len(lines)
+    while start < end and (not lines[start] or lines[start].isspace()):
+        start += 1
+    while end > start and (not lines[end - 1] or lines[end - 1].isspace()):
+        end -= 1
+    if start == end:
         return ""
+    lines = lines[start:end]
     prefix = _common_leading_ws(lines)
     if not prefix:
         return "\n".join(lines)
@@ -427,6 +547,10 @@ def _dedent_block(text: str) -> str:
     return "\n".join(out)
 
 
+# Prebuilt space runs for the fallback indenter; deeper pads are built on demand
+INDENT_STRINGS = tuple(" " * n for n in range(256))
+
+
 def _naive_perl_indent(code: str, width: int = 2) -> str:
     lines = code.splitlines()
     indent = 0
@@ -443,8 +567,8 @@ def _naive_perl_indent(code: str, width: int = 2) -> str:
         while i < len(stripped) and stripped[i] == '}':
             leading_closes += 1
             i += 1
-        indent_before = max(0, indent - leading_closes)
-        out.append((" " * (indent_before * width)) + stripped)
+        pad = max(0, indent - leading_closes) * width
+        out.append((INDENT_STRINGS[pad] if pad < 256 else " " * pad) + stripped)
         opens = ln.count("{")
         closes = ln.count("}")
         indent += (opens - closes)
@@ -470,15 +594,45 @@ def normalize_tpl_tag(
     return (open_part, "", "", body, close_part)
 
 
+def iter_tpl_tags(line: str) -> Iterator[Tuple[int, int, str, str, str, str]]:
+    """
+    Yield (start, end, leftchomp, kind, body, rightchomp) for each <% ... %>
+    in line, matching the tag regex checked in self_test. Delimiters, chomp
+    markers and kinds are all literals, so a find/startswith scan does the
+    job without entering the regex engine.
+    """
+    start = line.find("<%")
+    while start >= 0:
+        end = line.find("%>", start + 2)
+        if end < 0:
+            return
+        i = start + 2
+        leftchomp = ""
+        if line.startswith("-", i, end):
+            leftchomp = "-"
+            i += 1
+        kind = ""
+        if line.startswith("==", i, end):
+            kind = "=="
+        elif line.startswith(("=", "#"), i, end):
+            kind = line[i]
+        i += len(kind)
+        body = line[i:end]
+        rightchomp = ""
+        if body.endswith("-"):
+            rightchomp = "-"
+            body = body[:-1]
+        yield start, end + 2, leftchomp, kind, body, rightchomp
+        start = line.find("<%", end + 2)
+
+
 def substitute_tpl_tags_in_line(line: str, cfg: Config) -> str:
+    if "<%" not in line:
+        return line
     parts: List[str] = []
     last = 0
-    for m in TPL_TAG_RE.finditer(line):
-        parts.append(line[last : m.start()])
-        leftchomp = m.group("leftchomp") or ""
-        kind = m.group("kind") or ""
-        body = m.group("body")
-        rightchomp = m.group("rightchomp") or ""
+    for start, end, leftchomp, kind, body, rightchomp in iter_tpl_tags(line):
+        parts.append(line[last:start])
         open_part, _, _, new_body, close_part = normalize_tpl_tag(
             leftchomp, kind, body, rightchomp, cfg
         )
@@ -490,7 +644,7 @@ def substitute_tpl_tags_in_line(line: str, cfg: Config) -> str:
             else:
                 inner = tidy_perl_statement_oneline(body, cfg)
         parts.append(open_part + inner + close_part)
-        last = m.end()
+        last = end
     parts.append(line[last:])
     return "".join(parts)
 
@@ -503,60 +657,91 @@ def derive_html_tag_deltas(line_wo_tpl: str) -> Tuple[int, int, Optional[str], O
     - raw_open, raw_close: raw elements opened/closed on this line if they match exactly
     """
     s = line_wo_tpl
+    # Plain text lines (no tags at all) are common; skip every regex for them
+    if "<" not in s:
+        return 0, 0, None, None
 
     raw_open = None
     raw_close = None
-    m_open = RAW_OPEN_RE.match(s)
-    if m_open:
-        raw_open = m_open.group("name").lower()
-    m_close = RAW_CLOSE_RE.match(s)
-    if m_close:
-        raw_close = m_close.group("name").lower()
-
-    pre_dedent = 0
-    i = 0
-    while i < len(s) and s[i].isspace():
-        i += 1
-    while True:
-        m = TAG_RE.match(s, i)
-        if not m:
-            break
-        if m.group("slash"):
-            pre_dedent += 1
-            i = m.end()
-            while i < len(s) and s[i].isspace():
-                i += 1
-            continue
+    m_raw = RAW_LINE_RE.match(s)
+    if m_raw:
+        if m_raw.group("open"):
+            raw_open = m_raw.group("open").lower()
         else:
-            break
+            raw_close = m_raw.group("close").lower()
 
+    # Single pass over the tags: end tags contiguous with the start of the line
+    # (separated only by whitespace) count towards pre_dedent as well.
+    pre_dedent = 0
     net = 0
+    leading = True
+    pos = 0
     for m in TAG_RE.finditer(s):
-        slash = m.group("slash")
-        name = (m.group("name") or "").lower()
-        selfclose = bool(m.group("self"))
-        if slash:
+        if m.group("slash"):
             net -= 1
+            if leading:
+                # Still leading if only whitespace separates it from the
+                # previous leading end tag (or the start of the line)
+                gap = s[pos : m.start()]
+                if not gap or gap.isspace():
+                    pre_dedent += 1
+                    pos = m.end()
+                else:
+                    leading = False
         else:
-            if selfclose or name in VOID_ELEMENTS:
-                pass
-            else:
+            leading = False
+            # Only start tags need the (lowercased) name, for the void check
+            if not m.group("self") and m.group("name").lower() not in VOID_ELEMENTS:
                 net += 1
 
     return pre_dedent, net, raw_open, raw_close
 
 
 def strip_tpl_tags(line: str) -> str:
-    return TPL_TAG_RE.sub(lambda m: " " * (m.end() - m.start()), line)
+    # The delimiters are literals, so str.find locates the same spans as
+    # iter_tpl_tags (each <% up to the first following %>) without the regex engine.
+    start = line.find("<%")
+    if start < 0:
+        return line
+    parts: List[str] = []
+    pos = 0
+    while start >= 0:
+        end = line.find("%>", start + 2)
+        if end < 0:
+            break
+        end += 2
+        parts.append(line[pos:start])
+        parts.append(" " * (end - start))
+        pos = end
+        start = line.find("<%", pos)
+    parts.append(line[pos:])
+    return "".join(parts)
 
 
 def is_standalone_statement_tag(line: str) -> bool:
-    s = line.strip()
-    if not (s.startswith("<%") and s.endswith("%>")):
-        return False
-    if s.startswith("<%=") or s.startswith("<%=="):
+    if "<%" not in line:
         return False
-    return True
+    s = line.strip()
+    # "<%=" also covers "<%=="
+    return s.startswith("<%") and s.endswith("%>") and not s.startswith("<%=")
+
+
+def has_begin_word(line: str) -> bool:
+    """Same as re.search(r"\bbegin\b", line): "begin" not inside a longer word."""
+    i = line.find("begin")
+    while i >= 0:
+        j = i + 5
+        if (i == 0 or not (line[i - 1].isalnum() or line[i - 1] == "_")) and (
+            j == len(line) or not (line[j].isalnum() or line[j] == "_")
+        ):
+            return True
+        i = line.find("begin", j)
+    return False
+
+
+def is_line_directive(line: str) -> bool:
+    """Cheap prefix test equivalent to LINE_DIR_RE.match(line) succeeding."""
+    return "%" in line and line.lstrip().startswith("%")
 
 
 def compute_perl_deltas(line: str) -> Tuple[int, int]:
@@ -568,33 +753,25 @@ def compute_perl_deltas(line: str) -> Tuple[int, int]:
     dedent_before = 0
     delta_after = 0
 
-    if END_LINE_RE.match(line) or END_TAG_ONLY_RE.match(line):
-        dedent_before += 1
-
-    m = LEADING_RBRACE_COUNT_RE.match(line)
-    if m:
-        braces = m.group("braces") or ""
-        dedent_before += len(braces)
+    # Cheap substring checks first: most lines contain neither "end" nor "}"
+    if "end" in line or "}" in line:
+        m = PERL_DEDENT_RE.match(line)
+        if m:
+            dedent_before += PERL_DEDENT_BY_KIND[m.lastgroup](m)
 
-    if TAG_CLOSING_BRACE_ONLY_RE.match(line):
-        dedent_before += 1
+    m_dir = LINE_DIR_RE.match(line) if is_line_directive(line) else None
 
-    is_dir = bool(LINE_DIR_RE.match(line))
-    is_stmt_tag_only = is_standalone_statement_tag(line)
-
-    if is_dir:
-        body = LINE_DIR_RE.match(line).group("body")
+    if m_dir:
+        body = m_dir.group("body")
         open_count = body.count("{")
         close_count = body.count("}")
         delta_after += (open_count - close_count)
-        if BEGIN_RE.search(line):
+        if has_begin_word(line):
             delta_after += 1
-    elif is_stmt_tag_only:
-        bodies = [m.group("body") or "" for m in TPL_TAG_RE.finditer(line)]
-        open_count = sum(b.count("{") for b in bodies)
-        close_count = sum(b.count("}") for b in bodies)
-        delta_after += (open_count - close_count)
-        if BEGIN_RE.search(line):
+    elif is_standalone_statement_tag(line):
+        for _, _, _, _, body, _ in iter_tpl_tags(line):
+            delta_after += body.count("{") - body.count("}")
+        if has_begin_word(line):
             delta_after += 1
 
     return dedent_before, delta_after
@@ -606,9 +783,9 @@ def format_line_directive(line: str, cfg: Config) -> Optional[str]:
     directive string WITHOUT leading indentation (indent applied separately).
     Otherwise return None.
     """
-    m = LINE_DIR_RE.match(line)
-    if not m:
+    if not is_line_directive(line):
         return None
+    m = LINE_DIR_RE.match(line)
     kind = m.group("kind") or ""
     body = m.group("body")
 
@@ -624,30 +801,62 @@ def format_line_directive(line: str, cfg: Config) -> Optional[str]:
     else:
         inner = tidy_perl_statement_oneline(body, cfg)
 
-    if cfg.normalize_delimiter_spacing:
-        return "%" + kind + ((" " + inner) if inner else "")
-    else:
-        return "%" + kind + ((" " + inner) if inner else "")
+    return "%" + kind + ((" " + inner) if inner else "")
 
 
 def rstrip_trailing_ws(line: str) -> str:
     return line.rstrip(" \t")
 
 
+def _match_open_block(line: str) -> Optional[Tuple[str, str]]:
+    """Return (base indent, chomp) if line is a lone <% or <%-, else None."""
+    if "<%" not in line:
+        return None
+    rest = line.lstrip(" \t")
+    delim = rest.rstrip()
+    if delim not in OPEN_BLOCK_DELIMS:
+        return None
+    return line[: len(line) - len(rest)], delim[2:]
+
+
+def _match_close_block(line: str) -> Optional[Tuple[str, str]]:
+    """Return (base indent, chomp) if line is a lone %> or -%>, else None."""
+    if "%" not in line:
+        return None
+    rest = line.lstrip(" \t")
+    delim = rest.rstrip()
+    if delim not in CLOSE_BLOCK_DELIMS:
+        return None
+    return line[: len(line) - len(rest)], "-" if delim[0] == "-" else ""
+
+
 def format_extended_perl_blocks(text: str, cfg: Config) -> str:
     """
     Detect blocks where <% and %> are on their own lines (with optional chomp markers),
     format the inner Perl with perltidy (wrapped in do { ... }) or a naive indenter,
     and reinsert with the original base indentation.
     """
-    lines = text.splitlines()
+    out = format_extended_perl_block_lines(text.splitlines(), cfg)
+    return "\n".join(out) + ("\n" if text.endswith("\n") else "")
+
+
+def format_extended_perl_block_lines(lines: List[str], cfg: Config) -> List[str]:
+    """
+    Line-list form of format_extended_perl_blocks, so format_string can hand
+    over its output lines without joining and re-splitting the whole text.
+    """
     i = 0
     out: List[str] = []
     n = len(lines)
+    # Once a search for a closing delimiter runs off the end, later openers
+    # cannot find one either; skip the rescan instead of going quadratic.
+    no_more_closes = False
+    # (position in out, open line, close line, base, left, right, dedented body)
+    blocks: List[Tuple[int, int, int, str, str, str, str]] = []
 
     while i < n:
-        m_open = OPEN_BLOCK_RE.match(lines[i])
-        if not m_open:
+        m_open = _match_open_block(lines[i])
+        if m_open is None:
             out.append(lines[i])
             i += 1
             continue
@@ -655,21 +864,20 @@ def format_extended_perl_blocks(text: str, cfg: Config) -> str:
         # Find closing delimiter
         j = i + 1
         close = None
-        while j < n:
-            m_close = CLOSE_BLOCK_RE.match(lines[j])
-            if m_close:
-                close = m_close
+        while j < n and not no_more_closes:
+            close = _match_close_block(lines[j])
+            if close is not None:
                 break
             j += 1
 
         if close is None:
+            no_more_closes = True
             out.append(lines[i])
             i += 1
             continue
 
-        base = m_open.group("base") or ""
-        left = m_open.group("left") or ""
-        right = close.group("right") or ""
+        base, left = m_open
+        right = close[1]
 
         body_lines = lines[i + 1 : j]
         inner = "\n".join(body_lines)
@@ -677,24 +885,41 @@ def format_extended_perl_blocks(text: str, cfg: Config) -> str:
         # Dedent before formatting
         inner = _dedent_block(inner)
 
-        # Try perltidy; fallback to naive indentation
-        tidied = tidy_perl_block_multiline(inner, cfg)
-        if tidied is None:
-            logger.debug("EP block %d-%d: perltidy failed/unavailable; using naive indenter", i + 1, j + 1)
-            tidied = _naive_perl_indent(inner, width=cfg.indent_width)
-        else:
-            logger.debug("EP block %d-%d: perltidy formatted (%d lines)", i + 1, j + 1, len(tidied.splitlines()))
-
-        tidied = tidied.rstrip("\n")
-        out.append(f"{base}<%{left}")
-        if tidied:
-            for ln in tidied.splitlines():
-                out.append((base + ln) if ln else base)
-        out.append(f"{base}{right}%>")
+        # Leave a placeholder; all blocks go through perltidy together below
+        blocks.append((len(out), i, j, base, left, right, inner))
+        out.append("")
 
         i = j + 1  # continue after closing line
 
-    return "\n".join(out) + ("\n" if text.endswith("\n") else "")
+    if blocks:
+        tidied_blocks = tidy_perl_blocks_multiline([b[-1] for b in blocks], cfg)
+        expanded: List[List[str]] = []
+        for (_, bi, bj, base, left, right, inner), tidied in zip(blocks, tidied_blocks):
+            # Fallback to naive indentation where perltidy failed
+            if tidied is None:
+                logger.debug("EP block %d-%d: perltidy failed/unavailable; using naive indenter", bi + 1, bj + 1)
+                tidied = _naive_perl_indent(inner, width=cfg.indent_width)
+            elif logger.isEnabledFor(logging.DEBUG):
+                logger.debug("EP block %d-%d: perltidy formatted (%d lines)", bi + 1, bj + 1, len(tidied.splitlines()))
+
+            tidied = tidied.rstrip("\n")
+            block_lines = [f"{base}<%{left}"]
+            if tidied:
+                for ln in tidied.splitlines():
+                    block_lines.append((base + ln) if ln else base)
+            block_lines.append(f"{base}{right}%>")
+            expanded.append(block_lines)
+
+        merged: List[str] = []
+        last = 0
+        for (pos, *_), block_lines in zip(blocks, expanded):
+            merged.extend(out[last:pos])
+            merged.extend(block_lines)
+            last = pos + 1
+        merged.extend(out[last:])
+        out = merged
+
+    return out
 
 
 def format_string(src: str, cfg: Config) -> str:
@@ -707,56 +932,112 @@ def format_string(src: str, cfg: Config) -> str:
     in_raw: Optional[str] = None
 
     out_lines: List[str] = []
+    # Indent strings by level; depths cluster tightly, so build each one once
+    indent_cache: Dict[int, str] = {}
+    indent_width = cfg.indent_width
+
+    # Local aliases for the per-line hot path (avoids global/attribute lookups)
+    append = out_lines.append
+    perl_deltas = compute_perl_deltas
+    strip_tags = strip_tpl_tags
+    html_deltas = derive_html_tag_deltas
+    line_directive = format_line_directive
+    substitute_tags = substitute_tpl_tags_in_line
+    rstrip_ws = rstrip_trailing_ws
 
     for orig_line in lines:
         line = orig_line
 
         if in_raw:
-            m_close = RAW_CLOSE_RE.match(line)
+            m_close = RAW_CLOSE_RE.match(line) if "</" in line else None
             if m_close and m_close.group("name").lower() == in_raw:
                 indent_level = max(0, html_depth - 1) + perl_depth
-                indent = " " * (cfg.indent_width * indent_level)
+                indent = indent_cache.get(indent_level)
+                if indent is None:
+                    indent = indent_cache[indent_level] = " " * (indent_width * indent_level)
                 new_line = indent + line.lstrip()
-                out_lines.append(rstrip_trailing_ws(new_line))
+                append(rstrip_ws(new_line))
                 html_depth = max(0, html_depth - 1)
                 in_raw = None
             else:
-                out_lines.append(line)
+                append(line)
             continue
 
-        perl_dedent_before, perl_delta_after = compute_perl_deltas(line)
-        line_wo_tpl = strip_tpl_tags(line)
-        html_pre_dedent, html_net, raw_open, raw_close = derive_html_tag_deltas(line_wo_tpl)
+        perl_dedent_before, perl_delta_after = perl_deltas(line)
+        line_wo_tpl = strip_tags(line)
+        html_pre_dedent, html_net, raw_open, raw_close = html_deltas(line_wo_tpl)
 
         base_html_depth = max(0, html_depth - html_pre_dedent)
         base_perl_depth = max(0, perl_depth - perl_dedent_before)
         indent_level = max(0, base_html_depth + base_perl_depth)
-        indent = " " * (cfg.indent_width * indent_level)
+        indent = indent_cache.get(indent_level)
+        if indent is None:
+            indent = indent_cache[indent_level] = " " * (indent_width * indent_level)
 
-        formatted_directive = format_line_directive(line, cfg)
+        formatted_directive = line_directive(line, cfg)
         if formatted_directive is not None:
             content = formatted_directive
         else:
-            content = substitute_tpl_tags_in_line(line, cfg).lstrip()
+            content = substitute_tags(line, cfg).lstrip()
 
         new_line = indent + content.lstrip()
-        out_lines.append(rstrip_trailing_ws(new_line))
+        append(rstrip_ws(new_line))
 
         html_depth = max(0, base_html_depth + html_net + html_pre_dedent)
-        if raw_open and (raw_open.lower() in RAW_ELEMENTS):
-            in_raw = raw_open.lower()
+        # raw_open is already lowercased by derive_html_tag_deltas
+        if raw_open in RAW_ELEMENTS:
+            in_raw = raw_open
         perl_depth = max(0, base_perl_depth + perl_delta_after)
 
-    result = "\n".join(out_lines)
+    # A trailing empty entry is the final newline; it is re-added below
+    if out_lines and out_lines[-1] == "":
+        out_lines.pop()
 
     # Post-pass: format extended <% ... %> blocks
-    result = format_extended_perl_blocks(result, cfg)
-
-    if not result.endswith("\n"):
-        result += "\n"
+    out_lines = format_extended_perl_block_lines(out_lines, cfg)
 
+    # Lines carry no CR/LF of their own (input was normalized above and
+    # perltidy output is re-split), so join straight into the target EOL
     eol_mode = cfg.eol if cfg.eol != "preserve" else original_eol
-    result = normalize_eol(result, eol_mode)
+    eol = "\r\n" if eol_mode == "crlf" else "\n"
+    return eol.join(out_lines) + eol
+
+
+FORMAT_CACHE_SIZE = 32  # formatted documents kept by format_string_cached
+_FORMAT_CACHE: "OrderedDict[tuple, str]" = OrderedDict()
+_FORMAT_CACHE_LOCK = threading.Lock()
+
+
+def format_string_cached(src: str, cfg: Config) -> str:
+    """
+    format_string with a small LRU cache, for callers that reformat the same
+    buffer repeatedly (editor integrations, the web frontend). Keyed on a
+    digest of src plus the config fields that affect output. Output from a
+    run where perltidy failed is returned but not kept, so the fallback
+    formatting is not served once perltidy recovers.
+    """
+    key = (
+        hashlib.blake2b(src.encode("utf-8", "surrogatepass"), digest_size=16).digest(),
+        cfg.indent_width,
+        cfg.eol,
+        cfg.normalize_delimiter_spacing,
+        cfg.perltidy_path,
+        tuple(cfg.perltidy_options or ()),
+        cfg.perl_keyword_spacing,
+    )
+    with _FORMAT_CACHE_LOCK:
+        hit = _FORMAT_CACHE.get(key)
+        if hit is not None:
+            _FORMAT_CACHE.move_to_end(key)
+            return hit
+    _PERLTIDY_STATE.failed = False
+    result = format_string(src, cfg)
+    if _PERLTIDY_STATE.failed:
+        return result
+    with _FORMAT_CACHE_LOCK:
+        _FORMAT_CACHE[key] = result
+        while len(_FORMAT_CACHE) > FORMAT_CACHE_SIZE:
+            _FORMAT_CACHE.popitem(last=False)
     return result
 
 
@@ -769,6 +1050,19 @@ def read_text(path: Path) -> str:
         return raw.decode(errors="replace")
 
 
+def read_stdin() -> str:
+    # One binary read and one decode, as read_text does, instead of the
+    # text-mode reader's chunked incremental decoding
+    buf = getattr(sys.stdin, "buffer", None)
+    if buf is None:
+        return sys.stdin.read()
+    raw = buf.read()
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return raw.decode(errors="replace")
+
+
 def write_text(path: Path, text: str) -> None:
     with path.open("wb") as f:
         f.write(text.encode("utf-8"))
@@ -776,7 +1070,7 @@ def write_text(path: Path, text: str) -> None:
 
 def is_supported_file(path: Path, exts: Tuple[str, ...]) -> bool:
     name = path.name.lower()
-    return any(name.endswith(ext) for ext in exts)
+    return name.endswith(tuple(exts))
 
 
 def iter_files(paths: List[str], exts: Tuple[str, ...]) -> Iterable[Path]:
@@ -826,7 +1120,7 @@ def process_file(path: Path, cfg: Config, write: bool, show_diff: bool, backup:
 
 
 def process_stdin_stdout(cfg: Config) -> int:
-    data = sys.stdin.read()
+    data = read_stdin()
     formatted = format_string(data, cfg)
     sys.stdout.write(formatted)
     logger.info("Formatted stdin to stdout")
@@ -835,9 +1129,9 @@ def process_stdin_stdout(cfg: Config) -> int:
 
 def build_arg_parser() -> argparse.ArgumentParser:
     p = argparse.ArgumentParser(description="Format Mojolicious templates (.ep, .htm.ep, .html.ep)")
-    p.add_argument("paths", nargs="*", help="Files or directories")
+    p.add_argument("paths", nargs="*", help="Files or directories ('-' reads stdin)")
     p.add_argument("-w", "--write", action="store_true", help="Overwrite files in place (writes a .bak backup)")
-    p.add_argument("-o", "--out", help="Write formatted output to this file (single input file or --stdin). Conflicts with --write/--check/--diff")
+    p.add_argument("-o", "--out", help="Write formatted output to this file, or '-' for stdout (single input file or --stdin). Conflicts with --write/--check/--diff")
     p.add_argument("--check", action="store_true", help="Exit non-zero if any file would change")
     p.add_argument("--diff", action="store_true", help="Print unified diff for changes")
     p.add_argument("--stdin", action="store_true", help="Read from stdin")
@@ -913,6 +1207,20 @@ def self_test(cfg: Config) -> int:
     fmt_e = format_string(src_e, cfg)
     check("extended block indented", ("if (" in fmt_e and "say" in fmt_e and "{\n" in fmt_e) or ("if(" not in fmt_e))
 
+    # T7: the string scanners agree with the regexes they replace
+    tpl_tag_re = re.compile(r"<%(-)?(==|=|\#)?(.*?)(-)?%>")
+    begin_re = re.compile(r"\bbegin\b")
+    for line in (
+        "<%= $x %> and <%== $y -%><%# note %>",
+        "<%- trim -%> <%%> <%-%> <% 1 < 2 %> <% open",
+        "% begin",
+        "<%= form_for foo => begin %>",
+        "beginning began_begin _begin begin_",
+    ):
+        want = [(m.start(), m.end(), *(g or "" for g in m.groups())) for m in tpl_tag_re.finditer(line)]
+        check("iter_tpl_tags " + repr(line), list(iter_tpl_tags(line)) == want)
+        check("has_begin_word " + repr(line), has_begin_word(line) == bool(begin_re.search(line)))
+
     if failures:
         logger.error("SELF-TEST FAILURES:")
         for f in failures:
@@ -941,26 +1249,30 @@ def main(argv: Optional[List[str]] = None) -> int:
         if args.write or args.check or args.diff:
             parser.error("--out conflicts with --write/--check/--diff")
         cfg = load_config(args)
-        out_path = Path(args.out)
-        if args.stdin:
-            data = sys.stdin.read()
-            formatted = format_string(data, cfg)
-            write_text(out_path, formatted)
-            logger.info("Wrote %s (from stdin)", out_path)
-            return 0
-        # must be exactly one input file
-        if not args.paths or len(args.paths) != 1:
-            parser.error("--out requires exactly one input file (or use --stdin)")
-        in_path = Path(args.paths[0])
-        original = read_text(in_path)
+        # "-" stands for stdin (as the input path) or stdout (as --out)
+        if args.stdin or args.paths == ["-"]:
+            source = "stdin"
+            original = read_stdin()
+        else:
+            # must be exactly one input file
+            if not args.paths or len(args.paths) != 1:
+                parser.error("--out requires exactly one input file (or use --stdin)")
+            in_path = Path(args.paths[0])
+            source = str(in_path)
+            original = read_text(in_path)
         formatted = format_string(original, cfg)
-        write_text(out_path, formatted)
-        logger.info("Wrote %s (from %s)", out_path, in_path)
+        if args.out == "-":
+            sys.stdout.write(formatted)
+            logger.info("Formatted %s to stdout", source)
+        else:
+            out_path = Path(args.out)
+            write_text(out_path, formatted)
+            logger.info("Wrote %s (from %s)", out_path, source)
         return 0
 
     cfg = load_config(args)
 
-    if args.stdin:
+    if args.stdin or args.paths == ["-"]:
         return process_stdin_stdout(cfg)
 
     if not args.paths:
@@ -1,22 +1,48 @@
+# When run directly, patch blocking I/O for gevent before anything imports
+# socket/threading; under "gunicorn -k gevent" the worker already does this.
+if __name__ == "__main__":
+    try:
+        from gevent import monkey
+        monkey.patch_all()
+    except ImportError:
+        pass
+
 import os
 import sys
 import secrets
-import tempfile
-import subprocess
+import importlib.util
+import codecs
+import gzip
+import zlib
+import hashlib
+import hmac
+import threading
+import queue
+import atexit
 import re
 import logging
-from logging.handlers import RotatingFileHandler
-from flask import Flask, request, render_template_string, jsonify, send_file, redirect, url_for, flash
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from flask import Flask, Response, abort, request, jsonify, send_file, redirect, url_for, flash
+from flask.json.provider import DefaultJSONProvider
 from werkzeug.utils import secure_filename
 from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_talisman import Talisman
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_cors import CORS
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 from dotenv import load_dotenv
 import json
 
+# Optional C-accelerated JSON; falls back to the stdlib provider
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # --- ENV GENERATOR ---
 def generate_env():
     secret_key = secrets.token_urlsafe(32)
@@ -50,15 +76,53 @@ if not SECRET_KEY or not API_TOKEN:
 app = Flask(__name__)
 app.secret_key = SECRET_KEY
 
+if orjson is not None:
+    class OrjsonProvider(DefaultJSONProvider):
+        """Flask JSON provider backed by orjson, honouring sort_keys"""
+        def _options(self):
+            return orjson.OPT_SORT_KEYS if self.sort_keys else 0
+
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, default=self.default, option=self._options()).decode('utf-8')
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+        def response(self, *args, **kwargs):
+            # Use orjson's bytes as the body instead of decoding and re-encoding them
+            obj = self._prepare_response_obj(args, kwargs)
+            body = orjson.dumps(obj, default=self.default, option=self._options() | orjson.OPT_APPEND_NEWLINE)
+            return self._app.response_class(body, mimetype=self.mimetype)
+
+    app.json = OrjsonProvider(app)
+
+# Responses are small dicts built in a fixed order; skip sorting their keys and
+# never pretty-print, not even in debug (JSON_SORT_KEYS and
+# JSONIFY_PRETTYPRINT_REGULAR became these provider attributes in Flask 2.3)
+app.json.sort_keys = False
+app.json.compact = True
+
+MAX_INPUT_BYTES = 1024 * 1024  # 1MB
+
 # Enhanced app configuration
 app.config.update(
     SESSION_COOKIE_HTTPONLY=True,
     SESSION_COOKIE_SECURE=True,
     SESSION_COOKIE_SAMESITE='Lax',
-    MAX_CONTENT_LENGTH=1024 * 1024,  # 1MB limit
+    # Headroom over the 1MB input cap for the JSON envelope and escapes, so a
+    # body Werkzeug cuts off at this limit always fails the input size check
+    MAX_CONTENT_LENGTH=MAX_INPUT_BYTES + 64 * 1024,
     DEBUG=DEBUG_MODE
 )
 
+# Behind a reverse proxy every request arrives from the proxy's address, which
+# puts all clients in one rate-limit bucket. TRUSTED_PROXIES=N takes the client
+# address (and scheme) from the last N proxy hops; the default 0 trusts none,
+# since the headers are client-controlled when nothing strips them.
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', '0'))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
+
 # --- LOGGING CONFIGURATION ---
 if not app.debug:
     if not os.path.exists('logs'):
@@ -68,7 +132,13 @@ if not app.debug:
         '%(asctime)s %(levelname)s %(name)s %(threadName)s : %(message)s'
     ))
     file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
+    # Requests only enqueue records; a listener thread does the file writes and
+    # rotations, which would otherwise serialize requests on the handler lock
+    log_queue = queue.SimpleQueue()
+    app.logger.addHandler(QueueHandler(log_queue))
+    log_listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    log_listener.start()
+    atexit.register(log_listener.stop)  # flush what is still queued on exit
     app.logger.setLevel(logging.INFO)
     app.logger.info('Flask application startup')
 
@@ -104,9 +174,13 @@ def configure_security_headers(app):
             'form-action': ["'self'"]
         }
     
+    # Serialize the policy once; given a dict, Talisman rebuilds the header
+    # string on every response
+    csp_header = "; ".join(f"{directive} {' '.join(sources)}" for directive, sources in csp.items())
+    
     # Initialize Talisman with enhanced configuration
-    Talisman(app,
-        content_security_policy=csp,
+    talisman = Talisman(app,
+        content_security_policy=csp_header,
         force_https=not app.debug,  # Only force HTTPS in production
         strict_transport_security=not app.debug,  # Only enable HSTS in production
         strict_transport_security_max_age=31536000 if not app.debug else 0,
@@ -117,67 +191,112 @@ def configure_security_headers(app):
     )
     
     # Manual headers for Flask-Talisman 1.0.0 compatibility
-    @app.after_request
-    def add_security_headers(response):
+    extra_headers = {
         # Disable deprecated X-XSS-Protection (version 1.0.0 compatibility)
-        response.headers['X-XSS-Protection'] = '0'
-        
+        'X-XSS-Protection': '0',
         # Add Permissions-Policy for privacy (version 1.0.0 compatibility)
-        response.headers['Permissions-Policy'] = 'browsing-topics=()'
-        
+        'Permissions-Policy': 'browsing-topics=()',
         # Additional security headers
-        response.headers['X-Download-Options'] = 'noopen'
-        response.headers['X-Permitted-Cross-Domain-Policies'] = 'none'
-        
+        'X-Download-Options': 'noopen',
+        'X-Permitted-Cross-Domain-Policies': 'none',
+    }
+    
+    @app.after_request
+    def add_security_headers(response):
+        response.headers.update(extra_headers)
         return response
+    
+    return talisman
 
 # Apply security configuration
-configure_security_headers(app)
+talisman = configure_security_headers(app)
 
-# Enable CORS for all routes
-CORS(app)
+# Enable CORS for the API only; the page and health check are same-origin.
+# CORS_ORIGINS is a comma-separated list (default: any origin, as before)
+CORS_ORIGINS = [o.strip() for o in os.environ.get('CORS_ORIGINS', '*').split(',') if o.strip()]
+CORS(app, resources={r"/api/*": {"origins": CORS_ORIGINS}})
 
 # Enhanced rate limiting configuration
+# Shared storage keeps limits correct across workers and restarts, e.g.
+# RATELIMIT_STORAGE_URI=redis://localhost:6379/0; the in-memory default is
+# per-process, so N workers would allow N times the limit. The sliding window
+# counter approximates a rolling window from the current and previous fixed
+# window counts: O(1) and two integers per key, unlike moving-window's sorted
+# set of one entry per request, and without fixed-window's boundary bursts.
+RATELIMIT_STORAGE_URI = os.environ.get('RATELIMIT_STORAGE_URI', 'memory://')
+RATELIMIT_STRATEGY = os.environ.get('RATELIMIT_STRATEGY', 'sliding-window-counter')
+
 limiter = Limiter(
     key_func=get_remote_address,
     app=app,
     default_limits=["1000/day", "100/hour"],
-    storage_uri="memory://"  # Use Redis in production
+    storage_uri=RATELIMIT_STORAGE_URI,
+    strategy=RATELIMIT_STRATEGY,
+    # Keep limiting per-process rather than failing requests if Redis is down
+    in_memory_fallback_enabled=True
 )
 
 # --- INPUT VALIDATION ---
-def validate_input_text(text: str) -> bool:
-    """Validate input text for security"""
-    # Size limit (1MB)
-    if len(text.encode('utf-8')) > 1024 * 1024:
+# Printable ASCII plus common whitespace; compiled once rather than per request
+ALLOWED_TEXT_RE = re.compile(r'^[\x20-\x7E\s]*$')
+# The ASCII bytes ALLOWED_TEXT_RE accepts; text is valid if deleting them leaves nothing
+ALLOWED_ASCII = bytes(c for c in range(128) if ALLOWED_TEXT_RE.match(chr(c)))
+
+def is_allowed_text(text: str) -> bool:
+    """Same answer as ALLOWED_TEXT_RE.match, without the regex for ASCII text"""
+    if text.isascii():
+        return not text.encode('ascii').translate(None, ALLOWED_ASCII)
+    # \s also admits Unicode whitespace, which only the regex knows about
+    return ALLOWED_TEXT_RE.match(text) is not None
+
+def utf8_size_exceeds(text: str, limit: int = MAX_INPUT_BYTES) -> bool:
+    """True if text is over limit bytes as UTF-8, encoding only when unclear"""
+    # UTF-8 takes 1-4 bytes per character, so the length alone usually decides
+    n = len(text)
+    if n > limit:
+        return True
+    if n * 4 <= limit:
         return False
+    return len(text.encode('utf-8', 'surrogatepass')) > limit
+
+def validate_input_text(input_text, field="input_text") -> str:
+    """Validate submitted template text in one pass and return it"""
+    if not isinstance(input_text, str):
+        raise ValueError(f"{field} must be a string")
+    
+    if not input_text or input_text.isspace():
+        raise ValueError(f"{field} cannot be empty")
+    
+    if utf8_size_exceeds(input_text):
+        raise ValueError(f"{field} too large")
     
     # Content validation - only allow printable characters and common whitespace
-    if not re.match(r'^[\x20-\x7E\s]*$', text):
-        return False
+    if not is_allowed_text(input_text):
+        raise ValueError("Invalid input text")
     
-    return True
+    return input_text
 
-def validate_api_input(data):
-    """Validate API input data"""
+def validate_api_input(data, field="input_text") -> str:
+    """Validate API input data and return its text field"""
     if not isinstance(data, dict):
         raise ValueError("Invalid data format")
     
-    input_text = data.get("input_text", "")
-    if not isinstance(input_text, str):
-        raise ValueError("input_text must be a string")
-    
-    if len(input_text.strip()) == 0:
-        raise ValueError("input_text cannot be empty")
-    
-    if len(input_text.encode('utf-8')) > 1024 * 1024:  # 1MB
-        raise ValueError("input_text too large")
-    
-    return True
+    return validate_input_text(data.get(field, ""), field)
+
+def check_content_length():
+    """Abort with 413 unless the body declares a length within the limit"""
+    # A chunked body has no Content-Length, and Werkzeug silently truncates it
+    # at MAX_CONTENT_LENGTH rather than raising, so refuse it up front
+    length = request.content_length
+    if length is None or length > app.config["MAX_CONTENT_LENGTH"]:
+        abort(413)
 
 # --- FILE UPLOAD VALIDATION ---
 ALLOWED_EXTENSIONS = {'.ep'}
 MAX_FILE_SIZE = 1024 * 1024  # 1MB
+UPLOAD_CHUNK = 64 * 1024
+# The only non-printable characters an upload may contain
+UPLOAD_WHITESPACE_TABLE = str.maketrans('', '', '\n\r\t')
 
 def validate_file_upload(file):
     """Enhanced file validation"""
@@ -197,109 +316,209 @@ def validate_file_upload(file):
     if size > MAX_FILE_SIZE:
         return False, "File too large"
     
-    # Basic content validation
+    # Basic content validation, a chunk at a time rather than the whole file
+    decoder = codecs.getincrementaldecoder('utf-8')()
     try:
-        content = file.read().decode('utf-8')
-        file.seek(0)  # Reset
-        
-        # Validate content is text
-        if not content.isprintable() and not all(c in '\n\r\t' for c in content if not c.isprintable()):
-            return False, "Invalid file content"
+        while True:
+            chunk = file.read(UPLOAD_CHUNK)
+            content = decoder.decode(chunk, final=not chunk)
+            
+            # Validate content is text
+            if not content.translate(UPLOAD_WHITESPACE_TABLE).isprintable():
+                return False, "Invalid file content"
+            if not chunk:
+                break
             
     except UnicodeDecodeError:
         return False, "File must be valid UTF-8 text"
+    finally:
+        file.seek(0)  # Reset
     
     return True, "Valid file"
 
-# --- SECURE SUBPROCESS EXECUTION ---
-def get_formatter_version():
-    """Get formatter version safely"""
+# --- FORMATTER ---
+def load_formatter():
+    """Import mojofmt.py once so requests format in-process"""
+    if not os.path.exists(MOJO_FMT_PATH):
+        app.logger.error(f"Formatter script not found at {MOJO_FMT_PATH}")
+        return None
     try:
-        if not os.path.exists(MOJO_FMT_PATH):
-            app.logger.warning(f"Formatter script not found at {MOJO_FMT_PATH}")
-            return "Unknown"
-            
-        result = subprocess.run(
-            ["python3", MOJO_FMT_PATH, "--version"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            timeout=10  # Add timeout
-        )
-        if result.returncode == 0:
-            return result.stdout.strip()
-        else:
-            app.logger.warning(f"Could not get formatter version: {result.stderr}")
-            return "Unknown"
-    except subprocess.TimeoutExpired:
-        app.logger.warning("Formatter version check timed out")
-        return "Unknown"
+        spec = importlib.util.spec_from_file_location("mojofmt", MOJO_FMT_PATH)
+        module = importlib.util.module_from_spec(spec)
+        # Register before executing so the Config dataclass can resolve its module
+        sys.modules["mojofmt"] = module
+        spec.loader.exec_module(module)
+        return module
     except Exception as e:
-        app.logger.warning(f"Could not get formatter version: {e}")
+        sys.modules.pop("mojofmt", None)
+        app.logger.error(f"Could not load formatter: {e}")
+        return None
+
+MOJOFMT = load_formatter()
+
+def get_formatter_version():
+    """Formatter version from the loaded module"""
+    if MOJOFMT is None:
         return "Unknown"
+    return getattr(MOJOFMT, "VERSION", "Unknown")
+
+FORMATTER_VERSION = get_formatter_version()
+
+# Formatting runs on a shared pool so a request can give up after a timeout
+FORMAT_TIMEOUT = 30  # seconds
+
+def make_format_pool():
+    """Executor for format jobs, on real OS threads even under gevent"""
+    workers = os.cpu_count() or 2
+    if "gevent.monkey" in sys.modules and sys.modules["gevent.monkey"].is_module_patched("threading"):
+        # Patched threads are greenlets, so a CPU-bound format would stall every
+        # other request in the worker (and its own timeout). gevent's executor
+        # runs jobs on native threads and lets greenlets wait cooperatively.
+        from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+        return NativeThreadPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mojofmt")
+
+FORMAT_POOL = make_format_pool()
+
+def warm_formatter():
+    """Find perltidy and run it once, so the first request doesn't pay for either"""
+    ok, message = MOJOFMT.perltidy_probe(MOJOFMT.Config())
+    if ok:
+        app.logger.info(f"Formatter warm-up: {message}")
+    else:
+        app.logger.warning(f"Formatter warm-up: {message}")
+
+# In the background: startup isn't held up by a cold perltidy
+if MOJOFMT is not None:
+    FORMAT_POOL.submit(warm_formatter)
+
+# Identical inputs submitted concurrently share one pending job; finished
+# results are reused through mojofmt's own format_string_cached LRU
+_INFLIGHT = {}
+_INFLIGHT_LOCK = threading.Lock()
+
+def submit_format(input_text: str):
+    """Future for formatting input_text, joining an identical pending job"""
+    key = hashlib.blake2b(input_text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+    with _INFLIGHT_LOCK:
+        future = _INFLIGHT.get(key)
+        if future is not None:
+            return future
+        future = FORMAT_POOL.submit(MOJOFMT.format_string_cached, input_text, MOJOFMT.Config())
+        _INFLIGHT[key] = future
+    # Outside the lock: a job that already finished runs this immediately
+    future.add_done_callback(lambda f: _forget_inflight(key, f))
+    return future
+
+def _forget_inflight(key, future):
+    with _INFLIGHT_LOCK:
+        if _INFLIGHT.get(key) is future:
+            del _INFLIGHT[key]
 
 def run_mojofmt(input_text: str) -> str:
-    """Secure mojofmt execution with comprehensive validation"""
-    # Validate input first
-    if not validate_input_text(input_text):
-        raise ValueError("Invalid input text")
+    """Format input_text, which validate_api_input has already checked"""
+    if MOJOFMT is None:
+        raise RuntimeError("Formatter script not found")
     
     app.logger.debug("Running mojofmt")
-    with tempfile.TemporaryDirectory() as tmpdir:
-        in_path = os.path.join(tmpdir, "input.txt")
-        out_path = os.path.join(tmpdir, "output.txt")
-        
-        # Secure file writing
-        try:
-            with open(in_path, 'w', encoding='utf-8') as f:
-                f.write(input_text)
-        except Exception as e:
-            app.logger.error(f"Failed to write input file: {e}")
-            raise RuntimeError("Failed to write input file")
-        
-        # Validate formatter script exists
-        if not os.path.exists(MOJO_FMT_PATH):
-            app.logger.error(f"Formatter script not found at {MOJO_FMT_PATH}")
-            raise RuntimeError("Formatter script not found")
-        
-        # Secure subprocess execution with timeout
-        try:
-            result = subprocess.run(
-                ['python3', MOJO_FMT_PATH, '-o', out_path, in_path],
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE, 
-                text=True,
-                timeout=30,  # Add timeout
-                cwd=tmpdir   # Set working directory
-            )
-        except subprocess.TimeoutExpired:
-            app.logger.error("Formatting operation timed out")
-            raise RuntimeError("Formatting operation timed out")
-        except Exception as e:
-            app.logger.error(f"Subprocess execution failed: {e}")
-            raise RuntimeError("Formatting failed")
-        
-        if result.returncode != 0:
-            # Don't expose internal error details
-            app.logger.error(f"mojofmt failed with return code {result.returncode}: {result.stderr}")
-            raise RuntimeError("Formatting failed")
-        
-        try:
-            with open(out_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        except Exception as e:
-            app.logger.error(f"Failed to read output file: {e}")
-            raise RuntimeError("Failed to read output file")
+    future = submit_format(input_text)
+    try:
+        return future.result(timeout=FORMAT_TIMEOUT)
+    except FuturesTimeoutError:
+        app.logger.error("Formatting operation timed out")
+        raise RuntimeError("Formatting operation timed out")
+    except Exception as e:
+        # Don't expose internal error details
+        app.logger.error(f"mojofmt failed: {e}")
+        raise RuntimeError("Formatting failed")
 
-FORMATTER_VERSION = get_formatter_version()
+
+# --- OUTPUT POST-PROCESSING ---
+# A whitespace-only line (including a trailing one without a newline). Only
+# '\n' ends a line: unlike str.splitlines(), form feeds and other control
+# separators stay inside the line they appear in
+BLANK_LINE_RE = re.compile(r'^[^\S\n]*(?:\n|\Z)', re.M)
+
+def remove_empty_lines(text: str) -> str:
+    """Drop blank lines in one regex pass; like the old join, no trailing newline"""
+    text = BLANK_LINE_RE.sub('', text)
+    return text[:-1] if text.endswith('\n') else text
+
+# --- RESPONSES ---
+# Large results are streamed as JSON in slices rather than encoded into one
+# more full-size string; small ones go through jsonify as usual
+STREAM_THRESHOLD = 256 * 1024  # characters
+STREAM_CHUNK = 64 * 1024
+
+def json_string(text: str) -> bytes:
+    """text as a UTF-8 JSON string literal, quotes included"""
+    if orjson is not None:
+        return orjson.dumps(text)
+    return app.json.dumps(text).encode("utf-8")
+
+def formatted_text_response(text: str):
+    """JSON {"formatted_text": text} response, streamed for large text"""
+    # The shape never varies, so splice the encoded string into fixed bytes
+    # rather than serializing a one-key dict
+    if len(text) < STREAM_THRESHOLD:
+        return Response(b'{"formatted_text":' + json_string(text) + b'}\n', mimetype="application/json")
+
+    def generate():
+        yield b'{"formatted_text":"'
+        for i in range(0, len(text), STREAM_CHUNK):
+            # Encode each slice as a JSON string and drop its quotes
+            yield json_string(text[i:i + STREAM_CHUNK])[1:-1]
+        yield b'"}\n'
+
+    return Response(generate(), mimetype="application/json")
+
+# Formatted templates are highly repetitive text; gzip API responses above
+# COMPRESS_MIN_SIZE for clients that accept it (the index page is pre-gzipped)
+COMPRESS_MIN_SIZE = 1024  # bytes
+COMPRESS_LEVEL = 6
+COMPRESS_MIMETYPES = {"application/json", "text/plain"}
+
+def gzip_stream(chunks):
+    """Gzip an iterable of byte chunks as it is produced"""
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+@app.after_request
+def compress_api_response(response):
+    if (not request.path.startswith("/api/")
+            or response.mimetype not in COMPRESS_MIMETYPES
+            or "Content-Encoding" in response.headers):
+        return response
+    response.vary.add("Accept-Encoding")
+    if not request.accept_encodings["gzip"]:
+        return response
+    if response.is_streamed:
+        response.response = gzip_stream(response.iter_encoded())
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        response.set_data(gzip.compress(data, compresslevel=COMPRESS_LEVEL))
+    response.headers["Content-Encoding"] = "gzip"
+    return response
 
 # --- AUTHENTICATION ---
+API_TOKEN_BYTES = API_TOKEN.encode('utf-8')
+
 def require_api_token(f):
     """API token authentication decorator (unchanged)"""
     @wraps(f)
     def decorated(*args, **kwargs):
         auth = request.headers.get('Authorization', '')
-        if not auth.startswith('Bearer ') or auth[len('Bearer '):] != API_TOKEN:
+        # Constant-time compare so response timing doesn't leak the token
+        if not auth.startswith('Bearer ') or not hmac.compare_digest(
+            auth[len('Bearer '):].encode('utf-8'), API_TOKEN_BYTES
+        ):
             app.logger.warning(f"Unauthorized API access attempt from {request.remote_addr}")
             return jsonify({"error": "Unauthorized"}), 401
         return f(*args, **kwargs)
@@ -336,13 +555,11 @@ def handle_exception(e):
     app.logger.error(f"Unhandled exception: {e}", exc_info=True)
     return jsonify({"error": "Internal server error"}), 500
 
-# --- HTML TEMPLATE (unchanged) ---
-HTML_TEMPLATE = """
-<!DOCTYPE html>
-<html>
-<head>
-    <title>Mojolicious Template Code Formatter</title>
-    <style>
+# --- PAGE ASSETS ---
+# The page's stylesheet and script are served as separate, content-hashed files
+# so browsers cache them for good and only the small HTML is revalidated; as
+# same-origin files they also run under the production CSP without 'unsafe-inline'
+INDEX_CSS = """
         body {font-family:'Segoe UI', Arial, sans-serif; margin:0; padding:0;
               background:linear-gradient(90deg,#fdeff9 0%,#ecb6ff 100%);
               height:100vh; display:flex; flex-direction:column;}
@@ -354,6 +571,9 @@ HTML_TEMPLATE = """
         .icon-links a svg {width:28px; height:28px; fill:white;}
         .flash-messages ul {margin:0; padding:0; list-style:none; color:#d91454;text-align:center;}
         .flash-messages {min-height:20px;}
+        .flash-messages .flash-error {color:#d91454;}
+        .flash-messages .flash-success {color:#28a745;}
+        .remove-empty {margin-top:12px;}
         form {flex:1; display:flex; flex-direction:column;}
         .container {display:flex; flex-direction:row; gap:16px; padding:20px; flex:1;
                     box-sizing:border-box; height:calc(100vh - 140px);}
@@ -435,97 +655,9 @@ HTML_TEMPLATE = """
   gap: 6px; /* Space between label and dropdown */
 }
 
-    </style>
-    <link href="https://cdn.jsdelivr.net/npm/prismjs@1/themes/prism-tomorrow.min.css"
-          rel="stylesheet"
-          integrity="sha384-wFjoQjtV1y5jVHbt0p35Ui8aV8GVpEZkyF99OXWqP/eNJDU93D3Ugxkoyh6Y2I4A"
-          crossorigin="anonymous" />
-    <script src="https://cdn.jsdelivr.net/npm/prismjs@1/prism.min.js"
-            integrity="sha384-guvyurEPUUeAKyomgXWf/3v1dYx+etnMZ0CeHWsUXSqT1sRwh4iLpr9Z+Lw631fX"
-            crossorigin="anonymous"></script>
-    <script src="https://cdn.jsdelivr.net/npm/prismjs@1/components/prism-markup.min.js"
-            integrity="sha384-HkMr0bZB9kBW4iVtXn6nd35kO/L/dQtkkUBkL9swzTEDMdIe5ExJChVDSnC79aNA"
-            crossorigin="anonymous"></script>
-    <script src="https://cdn.jsdelivr.net/npm/prismjs@1/components/prism-perl.min.js"
-            integrity="sha384-TBezSCOvSMb3onoz0oj0Yi0trDW0ZQIz7CaneDU5q4gsUSqaPKMD6DlepFFJj+qa"
-            crossorigin="anonymous"></script>
-</head>
-<body>
-    <header>
-		 <h1>
-			Mojolicious Template Code Formatter
-			<span class="version-label">v{{ formatter_version }}</span>
-		</h1>
-		<div class="icon-links">
-			<a href="https://github.com/brianread108/mojofmt" target="_blank" aria-label="GitHub">
-			  <svg viewBox="0 0 16 16" role="img" aria-hidden="true" width="28" height="28" fill="white" xmlns="http://www.w3.org/2000/svg">
-				<path fill-rule="evenodd"
-				  d="M8 0C3.58 0 0 3.58 0 8a8.003 8.003 0 0 0 5.47 7.59c.4.07.55-.17.55-.38
-					0-.19-.01-.82-.01-1.49-2.01.37-2.53-.49-2.69-.94
-					-.09-.23-.48-.94-.82-1.13-.28-.15-.68-.52-.01-.53
-					.63-.01 1.08.58 1.23.82.72 1.21 
-					1.87.87 2.33.66.07-.52.28-.87.51-1.07
-					-1.78-.2-3.64-.89-3.64-3.95 
-					0-.87.31-1.59.82-2.15-.08-.2-.36-1.02.08-2.12 
-					0 0 .67-.21 2.2.82a7.5 7.5 0 0 1 
-					4.01 0c1.53-1.04 2.2-.82 2.2-.82
-					.44 1.1.16 1.92.08 2.12.51.56.82 
-					1.27.82 2.15 0 3.07-1.87 3.75-3.65 
-					3.95.29.25.54.73.54 1.48 
-					0 1.07-.01 1.93-.01 2.2 
-					0 .21.15.46.55.38A8.003 8.003 0 0 0 
-					16 8c0-4.42-3.58-8-8-8z"/>
-			  </svg>
-			</a>
-			<a href="https://mojolicious.org" target="_blank" aria-label="Mojolicious Website">
-			  <svg viewBox="0 0 64 64" width="28" height="28" role="img" aria-hidden="false" fill="white" xmlns="http://www.w3.org/2000/svg">
-				<path d="M32 2C20 18 20 30 20 40a12 12 0 0 0 24 0c0-14-12-24-12-38zM32 56a16 16 0 0 1-16-16c0-12 16-20 16-38 8 16 16 24 16 38a16 16 0 0 1-16 16z"/>
-			  </svg>
-			</a>
-		</div>
-    </header>
-    <div class="flash-messages" id="flash-messages">
-    </div>
-    <form id="mainform" onsubmit="return false;">
-      <div class="container">
-        <div class="panel">
-          <label for="input_text">Input data:</label>
-          <textarea name="input_text" id="input_text"></textarea>
-			<div class="file-upload">
-				<label for="input_file">Upload a file:</label>
-				<input type="file" name="input_file" id="input_file" accept=".ep">
-			</div>
-			<div class="controls">
-				<div class="controls-left">
-					<button type="button" id="format_btn">Format</button>
-				</div>
-				<div class="controls-right">
-					<button type="button" id="download_btn">Download</button>
-					<button type="button" id="clear_btn">Clear</button>
-				</div>
-			</div>
-          <label style="margin-top:12px;">
-            <input type="checkbox" name="remove_empty" id="remove_empty">
-            Remove empty lines from output
-          </label>
-        </div>
-        <div class="panel">
-<div class="output-header">
-  <label>Formatted Output:</label>
-  <div class="syntax-select">
-    <label for="syntaxmode">Output Syntax:</label>
-    <select id="syntaxmode" name="syntaxmode">
-      <option value="none">Plain Text</option>
-      <option value="perl">Perl</option>
-      <option value="html">HTML</option>
-    </select>
-  </div>
-</div>
-            <pre id="output_block"><code id="output_code" class="language-none"></code></pre>
-        </div>
-      </div>
-    </form>
-    <script>
+"""
+
+INDEX_JS = """
     document.addEventListener("DOMContentLoaded", function() {
         const inputTextEl = document.getElementById("input_text");
         const inputFileEl = document.getElementById("input_file");
@@ -549,7 +681,7 @@ HTML_TEMPLATE = """
 
         // Flash message functions
         function showFlashMessage(message, isError = true) {
-            flashMessagesEl.innerHTML = `<ul><li style="color: ${isError ? '#d91454' : '#28a745'}">${message}</li></ul>`;
+            flashMessagesEl.innerHTML = `<ul><li class="${isError ? 'flash-error' : 'flash-success'}">${message}</li></ul>`;
             setTimeout(() => {
                 flashMessagesEl.innerHTML = '';
             }, 5000);
@@ -586,9 +718,15 @@ HTML_TEMPLATE = """
             inputTextEl.style.height = Math.min(inputTextEl.scrollHeight, max) + "px";
         }
         
+        // At most one resize per frame, however fast the input events arrive
+        let resizeFrame = 0;
         inputTextEl.addEventListener("input", function() {
-            clearOutput();
-            autoResizeTextarea();
+            if (currentFormattedText) clearOutput();
+            if (resizeFrame) cancelAnimationFrame(resizeFrame);
+            resizeFrame = requestAnimationFrame(function() {
+                resizeFrame = 0;
+                autoResizeTextarea();
+            });
         });
 
         clearBtnEl.addEventListener("click", function() {
@@ -600,7 +738,7 @@ HTML_TEMPLATE = """
             clearOutput();
         });
 
-        inputFileEl.addEventListener("change", function(event) {
+        inputFileEl.addEventListener("change", async function(event) {
             const file = event.target.files[0];
             if (!file) {
                 uploadedFilename = '';
@@ -611,13 +749,14 @@ HTML_TEMPLATE = """
             uploadedFilename = file.name;
             updateFileInputDisplay();
             
-            const reader = new FileReader();
-            reader.onload = function(e) {
-                inputTextEl.value = e.target.result;
-                autoResizeTextarea();
-                clearOutput();
-            };
-            reader.readAsText(file);
+            try {
+                inputTextEl.value = await file.text();
+            } catch (error) {
+                showFlashMessage("Error reading file: " + error.message);
+                return;
+            }
+            autoResizeTextarea();
+            clearOutput();
         });
 
         syntaxModeEl.addEventListener("change", highlightOutput);
@@ -628,8 +767,19 @@ HTML_TEMPLATE = """
             Prism.highlightElement(outputCodeEl);
         }
         
+        // Prism highlights synchronously on the main thread; past this size
+        // the page would stall, so large output is shown as plain text
+        const MAX_HIGHLIGHT_CHARS = 200000;
+
         function highlightOutput() {
             outputCodeEl.className = "";
+            if (currentFormattedText.length > MAX_HIGHLIGHT_CHARS) {
+                outputCodeEl.classList.add("language-none");
+                if (syntaxModeEl.value !== "none") {
+                    showFlashMessage("Syntax highlighting disabled for large output.", false);
+                }
+                return;
+            }
             if (syntaxModeEl.value === "perl") outputCodeEl.classList.add("language-perl");
             else if (syntaxModeEl.value === "html") outputCodeEl.classList.add("language-markup");
             else outputCodeEl.classList.add("language-none");
@@ -665,21 +815,21 @@ HTML_TEMPLATE = """
             formatBtn.textContent = "Formatting...";
             formatBtn.disabled = true;
 
-            // Prepare data
-            const formData = {
-                input_text: inputText,
-                remove_empty: removeEmptyEl.checked
-            };
-
-            // Make AJAX request
-            fetch('/api/format_ajax', {
+            // Send the template as-is; errors still come back as JSON
+            const url = '/api/format_raw' + (removeEmptyEl.checked ? '?remove_empty=1' : '');
+            fetch(url, {
                 method: 'POST',
                 headers: {
-                    'Content-Type': 'application/json',
+                    'Content-Type': 'text/plain; charset=utf-8',
                 },
-                body: JSON.stringify(formData)
+                body: inputText
+            })
+            .then(response => {
+                if (response.ok) {
+                    return response.text().then(text => ({ formatted_text: text }));
+                }
+                return response.json().catch(() => ({ error: "Request failed (" + response.status + ")" }));
             })
-            .then(response => response.json())
             .then(data => {
                 if (data.error) {
                     showFlashMessage(data.error);
@@ -719,11 +869,174 @@ HTML_TEMPLATE = """
 
         highlightOutput();
     });
-    </script>
+"""
+
+# --- HTML TEMPLATE ---
+HTML_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Mojolicious Template Code Formatter</title>
+    <link href="{{ css_url }}" rel="stylesheet" />
+    <link href="https://cdn.jsdelivr.net/npm/prismjs@1/themes/prism-tomorrow.min.css"
+          rel="stylesheet"
+          integrity="sha384-wFjoQjtV1y5jVHbt0p35Ui8aV8GVpEZkyF99OXWqP/eNJDU93D3Ugxkoyh6Y2I4A"
+          crossorigin="anonymous" />
+    <script src="https://cdn.jsdelivr.net/npm/prismjs@1/prism.min.js"
+            integrity="sha384-guvyurEPUUeAKyomgXWf/3v1dYx+etnMZ0CeHWsUXSqT1sRwh4iLpr9Z+Lw631fX"
+            crossorigin="anonymous"></script>
+    <script src="https://cdn.jsdelivr.net/npm/prismjs@1/components/prism-markup.min.js"
+            integrity="sha384-HkMr0bZB9kBW4iVtXn6nd35kO/L/dQtkkUBkL9swzTEDMdIe5ExJChVDSnC79aNA"
+            crossorigin="anonymous"></script>
+    <script src="https://cdn.jsdelivr.net/npm/prismjs@1/components/prism-perl.min.js"
+            integrity="sha384-TBezSCOvSMb3onoz0oj0Yi0trDW0ZQIz7CaneDU5q4gsUSqaPKMD6DlepFFJj+qa"
+            crossorigin="anonymous"></script>
+</head>
+<body>
+    <header>
+		 <h1>
+			Mojolicious Template Code Formatter
+			<span class="version-label">v{{ formatter_version }}</span>
+		</h1>
+		<div class="icon-links">
+			<a href="https://github.com/brianread108/mojofmt" target="_blank" aria-label="GitHub">
+			  <svg viewBox="0 0 16 16" role="img" aria-hidden="true" width="28" height="28" fill="white" xmlns="http://www.w3.org/2000/svg">
+				<path fill-rule="evenodd"
+				  d="M8 0C3.58 0 0 3.58 0 8a8.003 8.003 0 0 0 5.47 7.59c.4.07.55-.17.55-.38
+					0-.19-.01-.82-.01-1.49-2.01.37-2.53-.49-2.69-.94
+					-.09-.23-.48-.94-.82-1.13-.28-.15-.68-.52-.01-.53
+					.63-.01 1.08.58 1.23.82.72 1.21 
+					1.87.87 2.33.66.07-.52.28-.87.51-1.07
+					-1.78-.2-3.64-.89-3.64-3.95 
+					0-.87.31-1.59.82-2.15-.08-.2-.36-1.02.08-2.12 
+					0 0 .67-.21 2.2.82a7.5 7.5 0 0 1 
+					4.01 0c1.53-1.04 2.2-.82 2.2-.82
+					.44 1.1.16 1.92.08 2.12.51.56.82 
+					1.27.82 2.15 0 3.07-1.87 3.75-3.65 
+					3.95.29.25.54.73.54 1.48 
+					0 1.07-.01 1.93-.01 2.2 
+					0 .21.15.46.55.38A8.003 8.003 0 0 0 
+					16 8c0-4.42-3.58-8-8-8z"/>
+			  </svg>
+			</a>
+			<a href="https://mojolicious.org" target="_blank" aria-label="Mojolicious Website">
+			  <svg viewBox="0 0 64 64" width="28" height="28" role="img" aria-hidden="false" fill="white" xmlns="http://www.w3.org/2000/svg">
+				<path d="M32 2C20 18 20 30 20 40a12 12 0 0 0 24 0c0-14-12-24-12-38zM32 56a16 16 0 0 1-16-16c0-12 16-20 16-38 8 16 16 24 16 38a16 16 0 0 1-16 16z"/>
+			  </svg>
+			</a>
+		</div>
+    </header>
+    <div class="flash-messages" id="flash-messages">
+    </div>
+    <form id="mainform">
+      <div class="container">
+        <div class="panel">
+          <label for="input_text">Input data:</label>
+          <textarea name="input_text" id="input_text"></textarea>
+			<div class="file-upload">
+				<label for="input_file">Upload a file:</label>
+				<input type="file" name="input_file" id="input_file" accept=".ep">
+			</div>
+			<div class="controls">
+				<div class="controls-left">
+					<button type="button" id="format_btn">Format</button>
+				</div>
+				<div class="controls-right">
+					<button type="button" id="download_btn">Download</button>
+					<button type="button" id="clear_btn">Clear</button>
+				</div>
+			</div>
+          <label class="remove-empty">
+            <input type="checkbox" name="remove_empty" id="remove_empty">
+            Remove empty lines from output
+          </label>
+        </div>
+        <div class="panel">
+<div class="output-header">
+  <label>Formatted Output:</label>
+  <div class="syntax-select">
+    <label for="syntaxmode">Output Syntax:</label>
+    <select id="syntaxmode" name="syntaxmode">
+      <option value="none">Plain Text</option>
+      <option value="perl">Perl</option>
+      <option value="html">HTML</option>
+    </select>
+  </div>
+</div>
+            <pre id="output_block"><code id="output_code" class="language-none"></code></pre>
+        </div>
+      </div>
+    </form>
+    <script src="{{ js_url }}"></script>
 </body>
 </html>
 """
 
+ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def build_asset(text, extension, mimetype):
+    """(name, body, gzipped body, mimetype) for a page asset, named by content hash"""
+    body = text.encode("utf-8")
+    name = f"app.{hashlib.sha1(body).hexdigest()[:12]}.{extension}"
+    return name, body, gzip.compress(body, compresslevel=9), mimetype
+
+ASSETS = {
+    asset[0]: asset
+    for asset in (
+        build_asset(INDEX_CSS, "css", "text/css"),
+        build_asset(INDEX_JS, "js", "text/javascript"),
+    )
+}
+CSS_NAME, JS_NAME = ASSETS
+
+# The page's variables are all fixed at startup, so render it once instead
+# of compiling the template on every request
+INDEX_HTML = app.jinja_env.from_string(HTML_TEMPLATE).render(
+    formatter_version=FORMATTER_VERSION,
+    css_url=f"/assets/{CSS_NAME}",
+    js_url=f"/assets/{JS_NAME}",
+)
+
+# Pre-compress the page and derive validators from it; each encoding gets its
+# own ETag since the bytes on the wire differ
+INDEX_HTML_BYTES = INDEX_HTML.encode("utf-8")
+INDEX_HTML_GZIP = gzip.compress(INDEX_HTML_BYTES, compresslevel=9)
+INDEX_ETAG = hashlib.sha1(INDEX_HTML_BYTES).hexdigest()
+INDEX_ETAG_GZIP = INDEX_ETAG + "-gzip"
+INDEX_CACHE_CONTROL = "public, max-age=3600, must-revalidate"
+# The page only changes with the code, so every worker reports the same time
+INDEX_LAST_MODIFIED = datetime.fromtimestamp(
+    int(max(os.path.getmtime(__file__), os.path.getmtime(MOJO_FMT_PATH) if MOJOFMT else 0)),
+    tz=timezone.utc,
+)
+
+# --- STATIC EXPORT ---
+def export_static(directory="static"):
+    """Write the rendered page (plus a .gz for gzip_static) for a reverse proxy.
+
+    With nginx in front, e.g. "location = / { try_files /index.html @app; }"
+    and "location /assets/ { try_files $uri @app; }" with sendfile on, only
+    /api/* and /health reach Flask.
+    """
+    os.makedirs(directory, exist_ok=True)
+    html_path = os.path.join(directory, "index.html")
+    with open(html_path, "wb") as f:
+        f.write(INDEX_HTML_BYTES)
+    with open(html_path + ".gz", "wb") as f:
+        f.write(INDEX_HTML_GZIP)
+    assets_dir = os.path.join(directory, "assets")
+    os.makedirs(assets_dir, exist_ok=True)
+    for name, body, body_gzip, _ in ASSETS.values():
+        with open(os.path.join(assets_dir, name), "wb") as f:
+            f.write(body)
+        with open(os.path.join(assets_dir, name + ".gz"), "wb") as f:
+            f.write(body_gzip)
+    print(f"✅ Wrote {html_path}, {html_path}.gz and {len(ASSETS)} assets in {assets_dir}")
+    sys.exit(0)
+
+if "--export-static" in sys.argv:
+    export_static()
+
 # --- ROUTES ---
 @app.route("/", methods=["GET", "POST"])
 def index():
@@ -735,11 +1048,42 @@ def index():
         app.logger.info(f"Traditional form submission redirected from {request.remote_addr}")
         return redirect(url_for('index'))
     
-    # Serve the HTML template
-    return render_template_string(
-        HTML_TEMPLATE,
-        formatter_version=FORMATTER_VERSION
-    )
+    # Serve the pre-rendered page, gzipped when the client accepts it
+    use_gzip = bool(request.accept_encodings["gzip"])
+    etag = INDEX_ETAG_GZIP if use_gzip else INDEX_ETAG
+    # If-None-Match wins when present; If-Modified-Since is the fallback validator
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    else:
+        since = request.if_modified_since
+        not_modified = since is not None and since >= INDEX_LAST_MODIFIED
+    if not_modified:
+        response = Response(status=304)
+    else:
+        response = Response(INDEX_HTML_GZIP if use_gzip else INDEX_HTML_BYTES, mimetype="text/html")
+        if use_gzip:
+            response.headers["Content-Encoding"] = "gzip"
+    response.set_etag(etag)
+    response.last_modified = INDEX_LAST_MODIFIED
+    response.headers["Cache-Control"] = INDEX_CACHE_CONTROL
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+@app.route("/assets/<name>", methods=["GET"])
+def page_asset(name):
+    """Content-hashed stylesheet and script for the page"""
+    asset = ASSETS.get(name)
+    if asset is None:
+        abort(404)
+    _, body, body_gzip, mimetype = asset
+    # The name changes with the content, so a cached copy never goes stale
+    use_gzip = bool(request.accept_encodings["gzip"])
+    response = Response(body_gzip if use_gzip else body, mimetype=mimetype)
+    if use_gzip:
+        response.headers["Content-Encoding"] = "gzip"
+    response.headers["Cache-Control"] = ASSET_CACHE_CONTROL
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
 
 @app.route("/api/format_ajax", methods=["POST"])
 @limiter.limit("5/minute")  # Stricter rate limiting
@@ -749,23 +1093,24 @@ def api_format_ajax():
         app.logger.warning(f"Non-JSON request to format_ajax from {request.remote_addr}")
         return jsonify({"error": "JSON body required"}), 400
     
+    # Reject oversized or unsized bodies from the header, before reading them
+    check_content_length()
+    
     try:
-        data = request.get_json()
-        validate_api_input(data)  # Enhanced input validation
-        
-        input_text = data.get("input_text", "")
+        # Parsed once and cached on the request; malformed JSON gives None,
+        # which validate_api_input rejects as a 400
+        data = request.get_json(silent=True)
+        input_text = validate_api_input(data)  # Enhanced input validation
         remove_empty = bool(data.get("remove_empty", False))
         
         app.logger.info(f"Processing format request from {request.remote_addr}, size: {len(input_text)} chars")
         
         formatted_text = run_mojofmt(input_text)
         if remove_empty:
-            formatted_text = "\n".join(
-                line for line in formatted_text.splitlines() if line.strip()
-            )
+            formatted_text = remove_empty_lines(formatted_text)
         
         app.logger.info(f"Successfully formatted text for {request.remote_addr}")
-        return jsonify({"formatted_text": formatted_text})
+        return formatted_text_response(formatted_text)
         
     except ValueError as e:
         app.logger.warning(f"Validation error from {request.remote_addr}: {e}")
@@ -786,27 +1131,26 @@ def api_format():
         app.logger.warning(f"Non-JSON request to format API from {request.remote_addr}")
         return jsonify({"error": "JSON body required"}), 400
     
+    # Reject oversized or unsized bodies from the header, before reading them
+    check_content_length()
+    
     try:
-        data = request.get_json()
-        
-        # Validate input using the same validation as AJAX endpoint
-        input_data = {
-            "input_text": data.get("text", ""),
-            "remove_empty": data.get("remove_empty", False)
-        }
-        validate_api_input(input_data)
+        # Parsed once and cached on the request; malformed JSON gives None,
+        # which validate_api_input rejects as a 400
+        data = request.get_json(silent=True)
         
-        text = input_data["input_text"]
-        remove_empty = bool(input_data["remove_empty"])
+        # Same validation as the AJAX endpoint, on this API's "text" field
+        text = validate_api_input(data, "text")
+        remove_empty = bool(data.get("remove_empty", False))
         
         app.logger.info(f"Processing authenticated API request from {request.remote_addr}, size: {len(text)} chars")
         
         formatted = run_mojofmt(text)
         if remove_empty:
-            formatted = "\n".join([line for line in formatted.splitlines() if line.strip()])
+            formatted = remove_empty_lines(formatted)
         
         app.logger.info(f"Successfully processed authenticated API request from {request.remote_addr}")
-        return jsonify({"formatted_text": formatted})
+        return formatted_text_response(formatted)
         
     except ValueError as e:
         app.logger.warning(f"API validation error from {request.remote_addr}: {e}")
@@ -818,16 +1162,78 @@ def api_format():
         app.logger.error(f"API unexpected error from {request.remote_addr}: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
+@app.route("/api/format_raw", methods=["POST"])
+@limiter.limit("5/minute")  # Stricter rate limiting
+def api_format_raw():
+    """Plain-text variant of format_ajax: the body is the template, no JSON either way"""
+    # Reject oversized or unsized bodies from the header, before reading them
+    check_content_length()
+    # Read one byte past the cap so a body the stream cut short can never be
+    # mistaken for a complete template
+    body = request.stream.read(MAX_INPUT_BYTES + 1)
+    if len(body) > MAX_INPUT_BYTES:
+        abort(413)
+    
+    try:
+        input_text = validate_input_text(body.decode("utf-8", "replace"))
+        remove_empty = request.args.get("remove_empty") == "1"
+        
+        app.logger.info(f"Processing raw format request from {request.remote_addr}, size: {len(input_text)} chars")
+        
+        formatted_text = run_mojofmt(input_text)
+        if remove_empty:
+            formatted_text = remove_empty_lines(formatted_text)
+        
+        app.logger.info(f"Successfully formatted text for {request.remote_addr}")
+        return Response(formatted_text, mimetype="text/plain")
+        
+    except ValueError as e:
+        app.logger.warning(f"Validation error from {request.remote_addr}: {e}")
+        return jsonify({"error": str(e)}), 400
+    except RuntimeError as e:
+        app.logger.error(f"Runtime error from {request.remote_addr}: {e}")
+        return jsonify({"error": "Processing failed"}), 500
+    except Exception as e:
+        app.logger.error(f"Unexpected error from {request.remote_addr}: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
 # --- HEALTH CHECK ENDPOINT ---
+# Every field is fixed for the life of the process, so serialize once; each
+# request still gets its own Response since after_request hooks modify it
+HEALTH_BODY = (app.json.dumps({
+    "status": "healthy",
+    "version": FORMATTER_VERSION,
+    "debug": app.debug
+}) + "\n").encode("utf-8")
+
+# Probes poll often and usually over plain HTTP inside the network: don't
+# spend the default rate limits on them or redirect them to HTTPS
 @app.route("/health", methods=["GET"])
+@limiter.exempt
+@talisman(force_https=False, content_security_policy=None)
 def health_check():
     """Health check endpoint"""
-    return jsonify({
-        "status": "healthy",
-        "version": FORMATTER_VERSION,
-        "debug": app.debug
-    })
+    return Response(HEALTH_BODY, mimetype="application/json")
 
 if __name__ == "__main__":
     app.logger.info(f"Starting Flask application in {'debug' if app.debug else 'production'} mode")
-    app.run(host="0.0.0.0", port=8000, debug=app.debug)
+    # Production: gunicorn -k gevent -w 4 -b 0.0.0.0:8000 website:app
+    try:
+        from gevent.pywsgi import WSGIServer
+    except ImportError:
+        WSGIServer = None
+    try:
+        from waitress import serve as waitress_serve
+    except ImportError:
+        waitress_serve = None
+    if WSGIServer is not None and not app.debug:
+        app.logger.info("Serving with gevent WSGIServer on 0.0.0.0:8000")
+        WSGIServer(("0.0.0.0", 8000), app).serve_forever()
+    elif waitress_serve is not None and not app.debug:
+        threads = int(os.environ.get("THREADS", "8"))
+        app.logger.info(f"Serving with waitress ({threads} threads) on 0.0.0.0:8000")
+        waitress_serve(app, host="0.0.0.0", port=8000, threads=threads)
+    else:
+        # The debugger runs arbitrary code from a browser, so debug only listens locally
+        host = "127.0.0.1" if app.debug else "0.0.0.0"
+        app.run(host=host, port=8000, debug=app.debug, use_reloader=app.debug)